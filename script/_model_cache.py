@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+SenseVoice 模型加载缓存
+AutoModel 初始化需要反序列化数百 MB 权重，同一进程内的多次导出/转换复用同一个实例
+"""
+
+import functools
+
+# 默认模型名称：各脚本使用同一名称加载，才能命中同一个缓存实例
+SENSEVOICE_MODEL = "iic/SenseVoiceSmall"
+
+
+@functools.lru_cache(maxsize=2)
+def _load_sensevoice(model_name, device):
+    from funasr import AutoModel
+    
+    # disable_update=False: 保留下载步骤原有的版本检查行为 (也是 FunASR 的默认值)
+    return AutoModel(
+        model=model_name,
+        trust_remote_code=True,
+        device=device,
+        disable_update=False,
+    )
+
+
+def get_sensevoice(model_name: str = SENSEVOICE_MODEL, device: str = "cpu"):
+    """
+    加载 (并缓存) FunASR SenseVoice 模型
+    
+    缓存以 (模型名称, 设备) 为键；传入本地模型路径会被视为不同的键并重新加载
+    
+    Args:
+        model_name: 模型名称或本地模型路径，如 "iic/SenseVoiceSmall"
+        device: 运行设备
+    
+    Returns:
+        funasr.AutoModel: 模型实例
+    """
+    # 统一以位置参数调用，避免关键字/位置参数写法不同导致缓存未命中
+    return _load_sensevoice(model_name, device)
@@ -5,55 +5,162 @@
 用于将音频转换为 SenseVoice 模型所需的特征格式
 """
 
+import functools
+import math
+
 import numpy as np
 
+try:
+    import torch
+    import torchaudio
+except ImportError:
+    torch = None
+    torchaudio = None
+
+try:
+    from numba import njit, prange
+except ImportError:
+    njit = None
+
+
+# Core ML 模型支持的输入帧数 (EnumeratedShapes)，客户端需将特征补零到最近的档位
+SEQ_LEN_BUCKETS = (300, 600, 1200, 3000)
+
+# torchaudio 特征计算所用设备（有 GPU 时优先使用）
+_DEVICE = "cuda" if torch is not None and torch.cuda.is_available() else "cpu"
+
 
 def load_audio(audio_path, sample_rate=16000):
     """
     加载音频文件
     
+    优先使用 soundfile 直接读取 (WAV/FLAC 等)，采样率不一致时用 torchaudio
+    重采样；不支持的格式回退到 librosa
+    
     Args:
         audio_path: 音频文件路径
         sample_rate: 采样率
     
     Returns:
-        numpy array: 音频数据
+        numpy array: 音频数据 (float32, 单声道, C 连续)
     """
+    try:
+        import soundfile as sf
+        audio, sr = sf.read(audio_path, dtype='float32', always_2d=False)
+    except (ImportError, RuntimeError):
+        audio, sr = None, None
+    
+    if audio is not None and (sr == sample_rate or torch is not None):
+        # 多声道取平均转为单声道
+        if audio.ndim == 2:
+            audio = audio.mean(axis=1)
+        
+        if sr != sample_rate:
+            audio = torchaudio.functional.resample(
+                torch.from_numpy(audio), sr, sample_rate
+            ).numpy()
+        
+        # 保证下游 FFT 走 FP32 连续内存的快速路径
+        return np.ascontiguousarray(audio, dtype=np.float32)
+    
     try:
         import librosa
         audio, sr = librosa.load(audio_path, sr=sample_rate)
-        return audio
+        return np.ascontiguousarray(audio, dtype=np.float32)
     except ImportError:
-        print("请安装 librosa: pip install librosa")
+        print("请安装 soundfile 或 librosa: pip install soundfile librosa")
         return None
 
 
+@functools.lru_cache(maxsize=None)
+def _get_mel_transform(sample_rate=16000, n_mels=80):
+    """
+    获取缓存的 torchaudio Mel 变换 (MelSpectrogram + AmplitudeToDB)
+    
+    参数与 librosa.feature.melspectrogram 保持一致 (slaney mel 刻度、
+    slaney 归一化、常数填充)，首次调用时构建并 JIT 编译
+    """
+    transform = torch.nn.Sequential(
+        torchaudio.transforms.MelSpectrogram(
+            sample_rate=sample_rate,
+            n_fft=512,
+            win_length=400,  # 25ms at 16kHz
+            hop_length=160,  # 10ms at 16kHz
+            n_mels=n_mels,
+            f_min=0,
+            f_max=8000,
+            pad_mode="constant",
+            norm="slaney",
+            mel_scale="slaney",
+        ),
+        torchaudio.transforms.AmplitudeToDB(stype="power", top_db=None),
+    )
+    return torch.jit.script(transform.to(_DEVICE).eval())
+
+
+if torch is not None:
+    # 导入时预先构建默认配置的变换，避免首次调用时的编译开销
+    _get_mel_transform()
+
+
+@functools.lru_cache(maxsize=None)
+def _get_librosa_mel_basis(sample_rate=16000, n_mels=80):
+    """获取缓存的 librosa Mel 滤波器组与窗函数 (librosa 回退路径使用)"""
+    import librosa
+    
+    mel_basis = librosa.filters.mel(sr=sample_rate, n_fft=512, n_mels=n_mels, fmin=0, fmax=8000)
+    window = librosa.filters.get_window("hann", 400, fftbins=True).astype(np.float32)
+    return mel_basis, window
+
+
 def compute_fbank(audio, sample_rate=16000, n_mels=80):
     """
     计算 Mel 频谱特征 (FBank)
     
+    优先使用 torchaudio (可 JIT 编译、可在 GPU 上运行)，未安装时回退到 librosa
+    
     Args:
-        audio: 音频数据 (numpy array)
+        audio: 音频数据 (numpy array；load_audio 的输出已是 float32 C 连续数组)
         sample_rate: 采样率
         n_mels: Mel 滤波器数量
     
     Returns:
         numpy array: FBank 特征 (time_steps, n_mels)
     """
+    # 输入已是 float32 C 连续数组时不会拷贝；其他 dtype (如 float64) 在此转换，
+    # 避免与 float32 的窗函数/Mel 滤波器运算时类型不匹配
+    audio = np.ascontiguousarray(audio, dtype=np.float32)
+    
+    if torch is not None:
+        transform = _get_mel_transform(sample_rate, n_mels)
+        
+        with torch.inference_mode():
+            log_mel = transform(torch.from_numpy(audio).to(_DEVICE))
+            # 与 librosa.power_to_db(ref=np.max) 保持一致：以最大值为参考，
+            # 并按默认 top_db=80 将下限截断到 -80 dB
+            log_mel = log_mel - log_mel.max()
+            log_mel = torch.clamp(log_mel, min=-80.0)
+        
+        # 转置为 (time, freq)
+        return log_mel.T.cpu().numpy()
+    
     try:
         import librosa
         
-        # 计算 mel spectrogram
-        mel_spec = librosa.feature.melspectrogram(
-            y=audio,
-            sr=sample_rate,
+        mel_basis, window = _get_librosa_mel_basis(sample_rate, n_mels)
+        
+        # 计算功率谱 (使用缓存的窗函数)
+        stft = librosa.stft(
+            audio,
             n_fft=512,
             hop_length=160,  # 10ms at 16kHz
             win_length=400,  # 25ms at 16kHz
-            n_mels=n_mels,
-            fmin=0,
-            fmax=8000
+            window=window
         )
+        power_spec = np.abs(stft) ** 2
+        
+        # 计算 mel spectrogram (使用缓存的 Mel 滤波器组)
+        mel_spec = mel_basis @ power_spec
         
         # 转换为 dB
         log_mel = librosa.power_to_db(mel_spec, ref=np.max)
@@ -64,24 +171,75 @@ def compute_fbank(audio, sample_rate=16000, n_mels=80):
         return fbank
         
     except ImportError:
-        print("请安装 librosa: pip install librosa")
+        print("请安装 torchaudio 或 librosa: pip install torchaudio")
         return None
 
 
+if njit is not None:
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _fused_norm(fbank):
+        """按列计算均值、中心化方差并原地归一化（float64 累加）"""
+        T, F = fbank.shape
+        for j in prange(F):
+            s = 0.0
+            for i in range(T):
+                s += fbank[i, j]
+            m = s / T
+            # 先中心化再求方差，避免 E[x^2] - E[x]^2 在低方差维度上的抵消误差
+            s2 = 0.0
+            for i in range(T):
+                d = fbank[i, j] - m
+                fbank[i, j] = d
+                s2 += d * d
+            inv = 1.0 / (math.sqrt(s2 / T) + 1e-5)
+            for i in range(T):
+                fbank[i, j] *= inv
+
+
 def normalize_fbank(fbank):
     """
     归一化 FBank 特征
     
+    直接在输入数组上原地归一化；安装了 numba 时使用 JIT 编译的融合内核
+    
     Args:
-        fbank: FBank 特征
+        fbank: FBank 特征 (浮点数组，会被原地修改)
     
     Returns:
-        numpy array: 归一化后的特征
+        numpy array: 归一化后的特征 (即输入数组本身)
     """
-    mean = np.mean(fbank, axis=0, keepdims=True)
-    std = np.std(fbank, axis=0, keepdims=True)
-    normalized = (fbank - mean) / (std + 1e-5)
-    return normalized
+    if njit is not None:
+        _fused_norm(fbank)
+        return fbank
+    
+    # 先原地中心化，再由中心化数据求方差：数值稳定，且无需 np.std 的临时数组
+    mean = fbank.mean(axis=0)
+    np.subtract(fbank, mean, out=fbank)
+    var = np.einsum('ij,ij->j', fbank, fbank) / fbank.shape[0]
+    inv_std = 1.0 / (np.sqrt(var) + 1e-5)
+    np.multiply(fbank, inv_std, out=fbank)
+    return fbank
+
+
+def pad_to_bucket(fbank, buckets=SEQ_LEN_BUCKETS):
+    """
+    将特征在时间维补零到不小于当前帧数的最小档位，超过最大档位时截断
+    
+    Args:
+        fbank: 特征 (time_steps, n_mels)
+        buckets: 可选的帧数档位 (升序)
+    
+    Returns:
+        numpy array: 补零后的特征 (bucket, n_mels)
+    """
+    num_frames = fbank.shape[0]
+    target = next((b for b in buckets if b >= num_frames), buckets[-1])
+    if num_frames >= target:
+        return fbank[:target]
+    
+    padded = np.zeros((target, fbank.shape[1]), dtype=fbank.dtype)
+    padded[:num_frames] = fbank
+    return padded
 
 
 def preprocess_audio(audio_path, sample_rate=16000, n_mels=80):
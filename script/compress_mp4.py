@@ -4,81 +4,204 @@ MP4视频压缩脚本
 遍历当前目录，找到所有MP4文件并使用ffmpeg进行压缩
 """
 
+import functools
 import os
 import subprocess
 import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 
 
-def compress_mp4(input_file):
+# 每个ffmpeg进程使用的编码线程数，并发任务数 = CPU核数 // 该值
+THREADS_PER_JOB = 2
+
+# 失败时输出的ffmpeg错误日志末尾字节数
+STDERR_TAIL_BYTES = 8192
+
+# 可用的H.264硬件编码器（按优先级），macOS仅考虑VideoToolbox
+HW_ENCODERS = ['h264_videotoolbox'] if sys.platform == 'darwin' else ['h264_nvenc', 'h264_qsv']
+
+# 多分辨率输出预设: (分辨率, 码率, 输出后缀)
+MULTI_RESOLUTION_PRESETS = [
+    ('1280x720', '2M', '720p'),
+    ('854x480', '1M', '480p'),
+]
+
+
+def _encoder_works(encoder):
+    """
+    用单帧测试编码确认编码器确实可用
+    
+    ffmpeg -encoders 只说明编译时包含该编码器，不代表本机有对应硬件/驱动
+    （例如无 NVIDIA 显卡时 h264_nvenc 报 "Cannot load libcuda"）
+    """
+    try:
+        subprocess.run(
+            [
+                'ffmpeg', '-hide_banner', '-nostdin', '-loglevel', 'error',
+                '-f', 'lavfi', '-i', 'color=c=black:s=640x360',
+                '-frames:v', '1', '-c:v', encoder, '-f', 'null', '-'
+            ],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            check=True,
+            timeout=15
+        )
+    except (subprocess.CalledProcessError, subprocess.TimeoutExpired, FileNotFoundError):
+        return False
+    return True
+
+
+@functools.lru_cache(maxsize=1)
+def detect_hw_encoder():
+    """
+    检测本机可用的H.264硬件编码器（结果缓存，只检测一次）
+    
+    先从 ffmpeg -encoders 中筛选已编译的候选，再逐个做单帧测试编码
+    
+    Returns:
+        str | None: 硬件编码器名称，不可用时返回None
+    """
+    try:
+        result = subprocess.run(
+            ['ffmpeg', '-hide_banner', '-encoders'],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            check=True
+        )
+    except (subprocess.CalledProcessError, FileNotFoundError):
+        return None
+    
+    # 每行格式如 " V....D h264_videotoolbox    VideoToolbox H.264 Encoder"
+    encoders = set()
+    for line in result.stdout.decode('utf-8', errors='ignore').splitlines():
+        fields = line.split()
+        if len(fields) > 1:
+            encoders.add(fields[1])
+    for encoder in HW_ENCODERS:
+        if encoder in encoders and _encoder_works(encoder):
+            return encoder
+    return None
+
+
+def _codec_args(bitrate=None):
+    """
+    生成编码参数：优先使用硬件编码器，否则使用 libx264 veryfast
+    
+    Args:
+        bitrate: 目标视频码率，None时硬件编码使用2M、软件编码使用CRF 23
+    """
+    hw_encoder = detect_hw_encoder()
+    if hw_encoder:
+        video = ['-c:v', hw_encoder, '-b:v', bitrate or '2M', '-tag:v', 'avc1']
+    elif bitrate:
+        video = ['-c:v', 'libx264', '-preset', 'veryfast', '-b:v', bitrate]
+    else:
+        video = ['-c:v', 'libx264', '-preset', 'veryfast', '-crf', '23']
+    return video + ['-c:a', 'aac', '-b:a', '128k', '-movflags', '+faststart']
+
+
+def _remove_temp_outputs(outputs):
+    """清理未完成的临时输出文件"""
+    for temp_output, _ in outputs:
+        if temp_output.exists():
+            os.remove(temp_output)
+
+
+def compress_mp4(input_file, threads=None, renditions=None):
     """
     使用ffmpeg压缩MP4文件
     
+    指定 renditions 时只解码一次输入，在同一个ffmpeg进程中同时编码出多个分辨率，
+    输出为 <原文件名>_<后缀>.mp4，原文件保留；否则压缩后替换原文件
+    
     Args:
         input_file: 输入的MP4文件路径
+        threads: ffmpeg编码线程数，None表示由ffmpeg自行决定
+        renditions: (分辨率, 码率, 输出后缀) 列表，如 [('1280x720', '2M', '720p')]
     
     Returns:
         bool: 压缩是否成功
     """
-    # 生成临时输出文件名
     input_path = Path(input_file)
-    temp_output = input_path.parent / f"{input_path.stem}_compressed{input_path.suffix}"
+    
+    # 生成临时输出文件名: [(临时文件, 最终文件, 该输出的编码参数)]
+    if renditions:
+        outputs = []
+        for scale, bitrate, out_suffix in renditions:
+            final_output = input_path.parent / f"{input_path.stem}_{out_suffix}{input_path.suffix}"
+            temp_output = input_path.parent / f"{input_path.stem}_{out_suffix}_compressed{input_path.suffix}"
+            options = ['-map', '0:v', '-map', '0:a?', '-s', scale] + _codec_args(bitrate)
+            outputs.append((temp_output, final_output, options))
+    else:
+        temp_output = input_path.parent / f"{input_path.stem}_compressed{input_path.suffix}"
+        outputs = [(temp_output, input_path, _codec_args())]
     
     print(f"正在压缩: {input_file}")
     
-    # ffmpeg压缩命令（使用默认配置，copy模式快速重封装）
+    # ffmpeg压缩命令（H.264 + AAC，moov前置便于边下边播）
     command = [
         'ffmpeg',
+        '-nostdin',            # 并发执行时不读取终端输入
         '-i', str(input_file),
         # '-c', 'copy',        # 直接复制流，不重新编码（最快）
         # '-y',                # 覆盖输出文件
-        str(temp_output)
     ]
+    # 每组输出参数都会在共享的解码流上再启动一个编码器
+    for temp_output, _, options in outputs:
+        command += options
+        if threads:
+            command += ['-threads', str(threads)]
+        command.append(str(temp_output))
+    
+    outputs = [(temp_output, final_output) for temp_output, final_output, _ in outputs]
     
     try:
-        # 执行ffmpeg命令
-        result = subprocess.run(
-            command,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            check=True
-        )
+        # 执行ffmpeg命令（stdout丢弃，stderr写入临时文件，仅失败时读取末尾部分）
+        with tempfile.TemporaryFile() as stderr_file:
+            result = subprocess.run(
+                command,
+                stdout=subprocess.DEVNULL,
+                stderr=stderr_file,
+                check=False
+            )
+            
+            if result.returncode != 0:
+                stderr_file.seek(max(0, stderr_file.tell() - STDERR_TAIL_BYTES))
+                print(f"✗ 压缩失败: {input_file}")
+                print(f"错误信息: {stderr_file.read().decode('utf-8', errors='ignore')}")
+                # 清理临时文件
+                _remove_temp_outputs(outputs)
+                return False
         
         # 检查输出文件是否创建成功
-        if temp_output.exists() and temp_output.stat().st_size > 0:
-            # 删除原文件
-            os.remove(input_file)
-            # 重命名压缩后的文件为原文件名
-            temp_output.rename(input_file)
+        if all(temp_output.exists() and temp_output.stat().st_size > 0
+               for temp_output, _ in outputs):
+            for temp_output, final_output in outputs:
+                # 原子替换为最终文件名（单输出时即覆盖原文件）
+                temp_output.replace(final_output)
             
             print(f"✓ 压缩成功: {input_file}")
             return True
         else:
             print(f"✗ 压缩失败: {input_file} - 输出文件无效")
-            if temp_output.exists():
-                os.remove(temp_output)
+            _remove_temp_outputs(outputs)
             return False
             
-    except subprocess.CalledProcessError as e:
-        print(f"✗ 压缩失败: {input_file}")
-        print(f"错误信息: {e.stderr.decode('utf-8', errors='ignore')}")
-        # 清理临时文件
-        if temp_output.exists():
-            os.remove(temp_output)
-        return False
     except Exception as e:
         print(f"✗ 发生错误: {input_file} - {str(e)}")
-        if temp_output.exists():
-            os.remove(temp_output)
+        _remove_temp_outputs(outputs)
         return False
 
 
-def find_and_compress_mp4_files(directory='.'):
+def find_and_compress_mp4_files(directory='.', renditions=None):
     """
     在指定目录中查找并压缩所有MP4文件
     
     Args:
         directory: 要搜索的目录，默认为当前目录
+        renditions: 多分辨率输出配置，参见 compress_mp4
     """
     directory_path = Path(directory)
     
@@ -95,8 +218,15 @@ def find_and_compress_mp4_files(directory='.'):
         print("macOS安装命令: brew install ffmpeg")
         sys.exit(1)
     
-    # 查找所有MP4文件
-    mp4_files = list(directory_path.glob('*.mp4'))
+    hw_encoder = detect_hw_encoder()
+    print(f"视频编码器: {hw_encoder or 'libx264 (软件编码)'}")
+    
+    # 查找所有MP4文件（os.scandir 直接使用目录项信息，无需逐个 stat）
+    with os.scandir(directory_path) as entries:
+        mp4_files = [
+            Path(entry.path) for entry in entries
+            if entry.is_file() and entry.name.lower().endswith('.mp4')
+        ]
     
     if not mp4_files:
         print(f"在目录 {directory} 中未找到MP4文件")
@@ -108,12 +238,19 @@ def find_and_compress_mp4_files(directory='.'):
     success_count = 0
     fail_count = 0
     
-    for mp4_file in mp4_files:
-        if compress_mp4(mp4_file):
-            success_count += 1
-        else:
-            fail_count += 1
-        print("-" * 50)
+    # 并发执行多个ffmpeg（subprocess.run 会释放GIL，线程池即可）
+    workers = max(1, min(len(mp4_files), (os.cpu_count() or 1) // THREADS_PER_JOB))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(compress_mp4, mp4_file, THREADS_PER_JOB, renditions)
+            for mp4_file in mp4_files
+        ]
+        for future in as_completed(futures):
+            if future.result():
+                success_count += 1
+            else:
+                fail_count += 1
+            print("-" * 50)
     
     # 输出统计信息
     print(f"\n压缩完成!")
@@ -123,5 +260,8 @@ def find_and_compress_mp4_files(directory='.'):
 
 if __name__ == '__main__':
     # 可以通过命令行参数指定目录，默认为当前目录
-    target_dir = sys.argv[1] if len(sys.argv) > 1 else '.'
-    find_and_compress_mp4_files(target_dir)
+    # 加上 --multi 参数时一次性输出 MULTI_RESOLUTION_PRESETS 中的多个分辨率
+    args = [arg for arg in sys.argv[1:] if arg != '--multi']
+    target_dir = args[0] if args else '.'
+    renditions = MULTI_RESOLUTION_PRESETS if '--multi' in sys.argv[1:] else None
+    find_and_compress_mp4_files(target_dir, renditions)
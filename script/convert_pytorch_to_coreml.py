@@ -9,6 +9,17 @@ import sys
 import os
 import argparse
 from pathlib import Path
+from typing import Tuple
+
+
+# 数值敏感、需要保持 FP32 计算的算子
+FP32_SENSITIVE_OPS = {"layer_norm", "softmax"}
+
+# W8A8 量化校准使用的最大推理次数
+MAX_CALIBRATION_STEPS = 32
+
+# k-means 调色板量化的默认位数 (64 个聚类中心)
+DEFAULT_PALETTIZE_BITS = 6
 
 
 def check_dependencies():
@@ -68,6 +79,15 @@ def load_pytorch_model(model_path):
         return None
 
 
+def fp16_compute_precision():
+    """FP16 计算精度 (ANE 最优)，FP32_SENSITIVE_OPS 中的算子保留 FP32"""
+    import coremltools as ct
+    
+    return ct.transform.FP16ComputePrecision(
+        op_selector=lambda op: op.op_type not in FP32_SENSITIVE_OPS
+    )
+
+
 def convert_to_coreml(model, output_path, input_shape=None):
     """转换 PyTorch 模型为 Core ML"""
     import torch
@@ -100,8 +120,10 @@ def convert_to_coreml(model, output_path, input_shape=None):
         coreml_model = ct.convert(
             traced_model,
             inputs=[ct.TensorType(name="audio", shape=input_shape)],
-            minimum_deployment_target=ct.target.iOS15,
-            compute_precision=ct.precision.FLOAT32,
+            minimum_deployment_target=ct.target.iOS16,
+            compute_precision=fp16_compute_precision(),
+            compute_units=ct.ComputeUnit.ALL,
+            skip_model_load=False,
         )
         
         # 设置元数据
@@ -126,22 +148,109 @@ def convert_to_coreml(model, output_path, input_shape=None):
         return False
 
 
-def convert_with_funasr():
-    """使用 FunASR 加载模型后转换"""
+def _calibration_batches(audio_paths):
+    """逐个音频生成校准输入，避免一次性加载全部音频"""
+    import torch
+    from audio_preprocessing import preprocess_audio
+    
+    for path in audio_paths:
+        features = preprocess_audio(path)
+        if features is None:
+            continue
+        yield {
+            'speech': torch.from_numpy(features).unsqueeze(0),
+            'speech_lengths': torch.tensor([features.shape[0]], dtype=torch.int32),
+        }
+
+
+def quantize_w8a8(model, example_inputs, calib_audio):
+    """
+    使用 coremltools.optimize.torch 对模型做 W8A8 线性量化
+    
+    Args:
+        model: 待量化的 PyTorch 模型
+        example_inputs: 示例输入元组 (speech, speech_lengths)，用于插入量化节点
+        calib_audio: 校准音频文件路径列表，使用真实 FBank 特征统计激活范围
+    
+    Returns:
+        torch.nn.Module: 量化后的模型
+    """
+    import torch
+    from coremltools.optimize.torch.quantization import (
+        LinearQuantizer,
+        LinearQuantizerConfig,
+        ModuleLinearQuantizerConfig,
+    )
+    
+    print(f"\n🗜️  W8A8 量化 (校准音频 {len(calib_audio)} 个)...")
+    
+    config = LinearQuantizerConfig(
+        global_config=ModuleLinearQuantizerConfig(
+            weight_dtype="qint8",
+            activation_dtype="quint8",
+            quantization_scheme="symmetric",
+            milestones=[0, 1000, 1000, 0],
+        )
+    )
+    quantizer = LinearQuantizer(model, config)
+    # prepare() 返回插入了观察器/FakeQuantize 节点的新 GraphModule，校准必须经过它
+    prepared = quantizer.prepare(example_inputs=example_inputs, inplace=True)
+    # prepare() 会切换到训练模式，校准前恢复推理模式以关闭 dropout
+    prepared.eval()
+    quantizer.step()
+    
+    # 使用真实音频特征校准 (逐个生成，内存中只保留一段音频的特征)
+    # inference_mode 下观察器的 min/max 缓冲区仍会正常更新，无需退回 no_grad
+    with torch.inference_mode():
+        for batch in _calibration_batches(calib_audio[:MAX_CALIBRATION_STEPS]):
+            prepared(**batch)
+    
+    quantized_model = quantizer.finalize()
+    print("✅ 量化完成")
+    return quantized_model
+
+
+def palettize_model(coreml_model, nbits=DEFAULT_PALETTIZE_BITS):
+    """
+    使用 k-means 调色板量化压缩 Core ML 模型权重
+    
+    Args:
+        coreml_model: 已转换的 Core ML 模型
+        nbits: 每个权重的位数 (聚类中心数为 2**nbits)
+    
+    Returns:
+        ct.models.MLModel: 压缩后的模型
+    """
+    from coremltools.optimize.coreml import (
+        OpPalettizerConfig,
+        OptimizationConfig,
+        palettize_weights,
+    )
+    
+    print(f"🎨 k-means 调色板量化 ({nbits} bit)...")
+    config = OptimizationConfig(global_config=OpPalettizerConfig(nbits=nbits, mode="kmeans"))
+    return palettize_weights(coreml_model, config)
+
+
+def convert_with_funasr(calib_audio=None, palettize_bits=DEFAULT_PALETTIZE_BITS):
+    """
+    使用 FunASR 加载模型后转换
+    
+    Args:
+        calib_audio: 校准音频文件路径列表，提供时在转换前做 W8A8 量化
+        palettize_bits: 权重调色板量化位数，0 表示不做调色板量化
+    """
     print("\n🔄 尝试使用 FunASR 加载模型...")
     
     try:
-        from funasr import AutoModel
+        import numpy as np
         import torch
         import coremltools as ct
+        from _model_cache import SENSEVOICE_MODEL, get_sensevoice
         
         # 加载 SenseVoice 模型
         print("📥 使用 FunASR 加载 SenseVoice...")
-        model = AutoModel(
-            model="iic/SenseVoiceSmall",
-            trust_remote_code=True,
-            device="cpu"
-        )
+        model = get_sensevoice(SENSEVOICE_MODEL, device="cpu")
         
         print("✅ 模型加载成功")
         
@@ -199,12 +308,16 @@ def convert_with_funasr():
             def __init__(self, model):
                 super().__init__()
                 self.encoder = model.encoder if hasattr(model, 'encoder') else model
+                # 在初始化时确定分支，便于 TorchScript 静态编译
+                self.encoder_callable: bool = callable(self.encoder)
             
-            def forward(self, speech):
-                # 简化输入：只接受音频
-                speech_lengths = torch.tensor([speech.shape[1]])
+            def forward(self, speech: torch.Tensor,
+                        speech_lengths: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor]:
+                # speech_lengths 为补零前的真实帧数，由调用方显式传入：
+                # 若从 speech.shape 推导，trace 时会被固化为示例长度，且无法区分补零帧
+                speech_lengths = speech_lengths.to(torch.int64)
                 # 使用 encoder 直接编码
-                if hasattr(self.encoder, '__call__'):
+                if self.encoder_callable:
                     encoder_out, encoder_out_lens = self.encoder(speech, speech_lengths)
                 else:
                     # 如果 encoder 不可调用，尝试直接返回输入
@@ -215,24 +328,57 @@ def convert_with_funasr():
         wrapped_model = SenseVoiceEncoderWrapper(pytorch_model)
         wrapped_model.eval()
         
-        # 准备简化的输入用于追踪
-        simple_input = torch.randn(1, seq_len, feat_dim)
+        # 准备简化的输入用于追踪 (使用默认档位的静态长度)
+        from audio_preprocessing import SEQ_LEN_BUCKETS
+        simple_input = (
+            torch.randn(1, SEQ_LEN_BUCKETS[0], feat_dim),
+            torch.tensor([SEQ_LEN_BUCKETS[0]], dtype=torch.int32),
+        )
+        
+        # W8A8 量化 (激活量化需要 iOS17+)
+        deployment_target = ct.target.iOS16
+        if calib_audio:
+            wrapped_model = quantize_w8a8(wrapped_model, simple_input, calib_audio)
+            deployment_target = ct.target.iOS17
         
-        print("\n📝 追踪模型...")
-        traced_model = torch.jit.trace(wrapped_model, simple_input)
+        # 优先使用 torch.jit.script 保留控制流、不固化序列长度；
+        # encoder 中存在无法脚本化的代码时回退到 trace
+        try:
+            print("\n📝 脚本化模型 (torch.jit.script)...")
+            scripted_model = torch.jit.script(wrapped_model)
+        except Exception as e:
+            print(f"⚠️  脚本化失败，回退到 torch.jit.trace: {e}")
+            scripted_model = torch.jit.trace(wrapped_model, simple_input)
+        # 此时 speech_lengths 是图的输入而非常量，各档位共用同一张图
         
         # 转换为 Core ML
+        # 使用分档静态形状代替 RangeDim，完全动态的长度会让部分算子回退到 CPU；
+        # 客户端需将特征补零到最近的档位 (参见 audio_preprocessing.pad_to_bucket)，
+        # 并通过 speech_lengths 传入补零前的真实帧数
         print("🔧 转换为 Core ML...")
         coreml_model = ct.convert(
-            traced_model,
-            inputs=[ct.TensorType(
-                name="speech",
-                shape=(1, ct.RangeDim(lower_bound=100, upper_bound=3000), feat_dim)
-            )],
-            minimum_deployment_target=ct.target.iOS15,
-            compute_precision=ct.precision.FLOAT16,  # 使用 FP16 减小模型体积
+            scripted_model,
+            inputs=[
+                ct.TensorType(
+                    name="speech",
+                    shape=ct.EnumeratedShapes(
+                        shapes=[(1, bucket, feat_dim) for bucket in SEQ_LEN_BUCKETS],
+                        default=(1, SEQ_LEN_BUCKETS[0], feat_dim),
+                    )
+                ),
+                ct.TensorType(name="speech_lengths", shape=(1,), dtype=np.int32),
+            ],
+            minimum_deployment_target=deployment_target,
+            compute_precision=fp16_compute_precision(),  # 使用 FP16 减小模型体积
+            compute_units=ct.ComputeUnit.ALL,
+            pass_pipeline=ct.PassPipeline.DEFAULT,
+            skip_model_load=False,
         )
         
+        # 权重调色板量化 (与 FP16/W8A8 叠加)
+        if palettize_bits:
+            coreml_model = palettize_model(coreml_model, palettize_bits)
+        
         # 设置元数据
         coreml_model.author = "FunAudioLLM"
         coreml_model.license = "MIT"
@@ -246,6 +392,8 @@ def convert_with_funasr():
         
         print(f"\n✅ 转换成功!")
         print(f"模型位置: {output_path}")
+        print(f"输入帧数档位: {list(SEQ_LEN_BUCKETS)} (推理前需将特征补零到最近的档位)")
+        print("speech_lengths: 补零前的真实帧数 (int32, 形状 [1])")
         
         return True
         
@@ -278,6 +426,19 @@ def main():
         action='store_true',
         help='使用 FunASR 加载模型'
     )
+    parser.add_argument(
+        '--calib-audio',
+        type=str,
+        nargs='+',
+        default=None,
+        help='W8A8 量化校准音频文件 (仅 --use-funasr，需要 iOS17+)'
+    )
+    parser.add_argument(
+        '--palettize-bits',
+        type=int,
+        default=DEFAULT_PALETTIZE_BITS,
+        help='权重 k-means 调色板量化位数，0 表示关闭 (仅 --use-funasr)'
+    )
     
     args = parser.parse_args()
     
@@ -303,7 +464,7 @@ def main():
     # 选择转换方式
     if args.use_funasr:
         print("\n使用 FunASR 方式加载模型")
-        success = convert_with_funasr()
+        success = convert_with_funasr(args.calib_audio, args.palettize_bits)
     else:
         print("\n使用直接加载方式")
         print("⚠️  注意: SenseVoice 模型结构复杂，直接加载可能失败")
@@ -13,8 +13,13 @@ SenseVoice 模型转换脚本
 import os
 import sys
 import shutil
+import hashlib
+import subprocess
 from pathlib import Path
 
+# ONNX -> Core ML 转换结果缓存目录
+CACHE_DIR = Path(__file__).resolve().parent / ".cache"
+
 def check_dependencies():
     """检查必要的依赖"""
     required_packages = [
@@ -44,16 +49,12 @@ def check_dependencies():
 
 def download_sensevoice_model(model_dir="./models"):
     """下载 SenseVoice 模型"""
-    from funasr import AutoModel
+    from _model_cache import SENSEVOICE_MODEL, get_sensevoice
     
     print("\n📥 下载 SenseVoice-Small 模型...")
     
     try:
-        model = AutoModel(
-            model="iic/SenseVoiceSmall",
-            trust_remote_code=True,
-            disable_update=False,
-        )
+        model = get_sensevoice(SENSEVOICE_MODEL, device="cpu")
         
         model_path = model.model_path
         print(f"✅ 模型下载成功: {model_path}")
@@ -63,23 +64,25 @@ def download_sensevoice_model(model_dir="./models"):
         return None
 
 
-def export_to_onnx(model_path, output_dir="./onnx_models"):
-    """导出模型为 ONNX 格式"""
+def export_to_onnx(model_name=None, output_dir="./onnx_models"):
+    """
+    导出模型为 ONNX 格式
+    
+    Args:
+        model_name: 模型名称，默认与下载步骤相同，从而复用已加载的模型实例
+        output_dir: ONNX 输出目录
+    """
     print("\n🔄 导出模型为 ONNX 格式...")
     
     try:
-        from funasr import AutoModel
         import torch
+        from _model_cache import SENSEVOICE_MODEL, get_sensevoice
         
         # 创建输出目录
         os.makedirs(output_dir, exist_ok=True)
         
-        # 加载模型
-        model = AutoModel(
-            model=model_path,
-            trust_remote_code=True,
-            device="cpu"  # 使用 CPU 进行导出
-        )
+        # 加载模型 (使用 CPU 进行导出)；与下载步骤使用相同的模型名称，命中同一个缓存实例
+        model = get_sensevoice(model_name or SENSEVOICE_MODEL, device="cpu")
         
         # 准备示例输入
         # SenseVoice 输入: (batch_size, seq_len, feat_dim)
@@ -154,22 +157,52 @@ def use_funasr_onnx_export(model_name="iic/SenseVoiceSmall"):
         return None
 
 
+def _onnx_sha256(onnx_path, chunk_size=1 << 20):
+    """计算 ONNX 模型 (含外部权重 .data 文件) 的 SHA-256"""
+    digest = hashlib.sha256()
+    for path in (onnx_path, onnx_path + ".data"):
+        if not os.path.exists(path):
+            continue
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
 def convert_onnx_to_coreml(onnx_path, output_dir="./coreml_models"):
-    """将 ONNX 模型转换为 Core ML 格式"""
+    """
+    将 ONNX 模型转换为 Core ML 格式
+    
+    转换结果按 ONNX 文件的 SHA-256 缓存在 .cache/ 下，相同模型再次运行时直接复用
+    """
     print("\n🔄 转换 ONNX 为 Core ML 格式...")
     
     try:
         import coremltools as ct
-        from coremltools.converters.onnx import convert
+        from coremltools.proto import Model_pb2
         
         # 创建输出目录
         os.makedirs(output_dir, exist_ok=True)
         
-        # 转换为 Core ML
-        coreml_model = convert(
-            model=onnx_path,
-            minimum_deployment_target=ct.target.iOS15,
-        )
+        cache_path = CACHE_DIR / f"coreml_{_onnx_sha256(onnx_path)}.spec"
+        
+        if cache_path.exists():
+            print(f"♻️  使用缓存的转换结果: {cache_path}")
+            spec = Model_pb2.Model()
+            spec.ParseFromString(cache_path.read_bytes())
+            coreml_model = ct.models.MLModel(spec)
+        else:
+            from coremltools.converters.onnx import convert
+            
+            # 转换为 Core ML
+            coreml_model = convert(
+                model=onnx_path,
+                minimum_deployment_target=ct.target.iOS15,
+            )
+            
+            # 缓存转换结果
+            CACHE_DIR.mkdir(parents=True, exist_ok=True)
+            cache_path.write_bytes(coreml_model.get_spec().SerializeToString())
         
         # 设置模型元数据
         coreml_model.author = "FunAudioLLM"
@@ -192,24 +225,32 @@ def convert_onnx_to_coreml(onnx_path, output_dir="./coreml_models"):
 
 
 def compile_coreml_model(mlmodel_path):
-    """编译 Core ML 模型为 .mlmodelc 格式"""
+    """
+    编译 Core ML 模型为 .mlmodelc 格式
+    
+    使用 Xcode 自带的 coremlcompiler (仅 macOS)；不可用时可跳过，
+    Xcode 构建或应用首次加载时也会自动编译
+    """
     print("\n🔧 编译 Core ML 模型...")
     
     try:
-        import coremltools as ct
+        output_dir = os.path.dirname(os.path.abspath(mlmodel_path))
         
-        # 加载模型
-        model = ct.models.MLModel(mlmodel_path)
-        
-        # 编译后的路径
-        output_path = mlmodel_path.replace('.mlmodel', '.mlmodelc')
+        # 编译模型 (生成 <output_dir>/<模型名>.mlmodelc)
+        subprocess.run(
+            ["xcrun", "coremlcompiler", "compile", mlmodel_path, output_dir],
+            check=True
+        )
         
-        # 编译模型
-        model.save(output_path)
+        model_name = os.path.splitext(os.path.basename(mlmodel_path))[0]
+        output_path = os.path.join(output_dir, f"{model_name}.mlmodelc")
         
         print(f"✅ 模型编译成功: {output_path}")
         return output_path
         
+    except FileNotFoundError:
+        print("⚠️  未找到 xcrun，跳过编译 (Xcode 构建时会自动编译模型)")
+        return None
     except Exception as e:
         print(f"❌ 模型编译失败: {e}")
         return None
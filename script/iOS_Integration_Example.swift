@@ -63,9 +63,11 @@ class SenseVoiceMLModel {
         // let melSpectrogram = computeMelSpectrogram(audioSamples, nFFT: nFFT, hopLength: hopLength, nMels: nMels)
         
         // 3. 转换为 MLMultiArray
+        // 模型只接受固定的帧数档位 [300, 600, 1200, 3000]，
+        // 需要将特征在时间维补零到不小于实际帧数的最小档位
         // 示例: 创建一个占位符
         do {
-            let shape = [1, 100, 80] as [NSNumber]  // [batch, time, features]
+            let shape = [1, 300, 80] as [NSNumber]  // [batch, time, features]
             let mlArray = try MLMultiArray(shape: shape, dataType: .float32)
             
             // 填充数据
@@ -98,6 +100,8 @@ class SenseVoiceMLModel {
         }
         
         // 2. 创建输入
+        // 由 convert_pytorch_to_coreml.py 转换的模型还需要 "speech_lengths" 输入:
+        // 形状 [1] 的 Int32 数组，值为补零前的真实帧数，模型据此屏蔽补零部分
         let input = try MLDictionaryFeatureProvider(dictionary: [
             "audio_features": melFeatures
         ])
@@ -8,11 +8,25 @@ import sys
 import os
 
 
+def random_features(shape=(1, 100, 80)):
+    """
+    直接以 FP32 生成随机测试特征 (无需 FP64 -> FP32 转换)
+    
+    Args:
+        shape: 特征形状 (batch_size, time_steps, features)
+    
+    Returns:
+        numpy array: 随机特征
+    """
+    import numpy as np
+    
+    return np.random.default_rng().standard_normal(size=shape, dtype=np.float32)
+
+
 def test_coreml_model(model_path):
     """测试 Core ML 模型"""
     try:
         import coremltools as ct
-        import numpy as np
         
         print(f"📂 加载模型: {model_path}")
         model = ct.models.MLModel(model_path)
@@ -34,7 +48,7 @@ def test_coreml_model(model_path):
         print("\n🧪 创建测试输入...")
         # 假设输入是 (1, 100, 80) - batch_size, time_steps, features
         test_input = {
-            'audio_features': np.random.randn(1, 100, 80).astype(np.float32)
+            'audio_features': random_features((1, 100, 80))
         }
         
         print("🔄 运行推理...")
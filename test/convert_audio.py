@@ -9,12 +9,35 @@ import wave
 import sys
 import os
 import struct
+from math import gcd
+
+# 可选：Numba JIT 编译声道混合内核（依赖 numpy，cache=True 缓存编译结果）
+try:
+    import numpy as _np
+    from numba import njit
+    
+    @njit(cache=True)
+    def _downmix_i16(samples, channels):
+        """将交错的 int16 多声道采样按帧平均为单声道（int32 累加，向下取整）"""
+        n = samples.shape[0] // channels
+        out = _np.empty(n, dtype=_np.int16)
+        for i in range(n):
+            acc = _np.int32(0)
+            base = i * channels
+            for c in range(channels):
+                acc += samples[base + c]
+            out[i] = acc // channels
+        return out
+except ImportError:
+    _downmix_i16 = None
 
 
 def convert_to_mono(input_file: str, output_file: str = None):
     """
     将立体声音频转换为单声道
     
+    按块（约 1 秒）流式读取、转换并写入，内存占用与文件长度无关
+    
     Args:
         input_file: 输入的 WAV 文件路径
         output_file: 输出的 WAV 文件路径（可选）
@@ -38,41 +61,98 @@ def convert_to_mono(input_file: str, output_file: str = None):
             print("已经是单声道，无需转换")
             return input_file
         
-        # 读取所有帧
-        frames = wf_in.readframes(nframes)
-        
-        # 转换为单声道（取平均值）
-        if sample_width == 2:  # 16-bit
-            # 解包为采样点
-            samples = struct.unpack(f'<{nframes * channels}h', frames)
-            
-            # 平均多个声道
-            mono_samples = []
-            for i in range(0, len(samples), channels):
-                avg = sum(samples[i:i+channels]) // channels
-                mono_samples.append(avg)
-            
-            # 重新打包
-            mono_frames = struct.pack(f'<{len(mono_samples)}h', *mono_samples)
-        else:
+        if sample_width != 2:  # 仅支持 16-bit
             raise ValueError(f"不支持的采样宽度: {sample_width} 字节")
         
+        try:
+            import numpy as np
+        except ImportError:
+            np = None
+        
+        # 每块读取的帧数（约 1 秒）
+        block_frames = framerate
+        if np is not None:
+            # 预分配可复用的缓冲区
+            acc = np.empty(block_frames, dtype=np.int32)
+            out = np.empty(block_frames, dtype='<i2')
+        
+        mono_count = 0
+        
         # 写入单声道文件
         with wave.open(output_file, 'wb') as wf_out:
             wf_out.setnchannels(1)
             wf_out.setsampwidth(sample_width)
             wf_out.setframerate(framerate)
-            wf_out.writeframes(mono_frames)
+            
+            while True:
+                frames = wf_in.readframes(block_frames)
+                if not frames:
+                    break
+                
+                # 转换为单声道（取平均值）
+                if _downmix_i16 is not None:
+                    samples = np.frombuffer(frames, dtype='<i2')
+                    mono = _downmix_i16(samples, channels)
+                    n = len(mono)
+                    mono_frames = mono.tobytes()
+                elif np is not None:
+                    # 使用 int32 累加避免溢出，整除与原逐点实现保持一致
+                    samples = np.frombuffer(frames, dtype='<i2').reshape(-1, channels)
+                    n = len(samples)
+                    np.sum(samples, axis=1, dtype=np.int32, out=acc[:n])
+                    np.floor_divide(acc[:n], channels, out=acc[:n])
+                    out[:n] = acc[:n]
+                    mono_frames = out[:n].tobytes()
+                else:
+                    # 解包为采样点
+                    n = len(frames) // (sample_width * channels)
+                    samples = struct.unpack(f'<{n * channels}h', frames)
+                    
+                    # 平均多个声道
+                    mono_samples = []
+                    for i in range(0, len(samples), channels):
+                        avg = sum(samples[i:i+channels]) // channels
+                        mono_samples.append(avg)
+                    
+                    # 重新打包
+                    mono_frames = struct.pack(f'<{n}h', *mono_samples)
+                
+                wf_out.writeframes(mono_frames)
+                mono_count += n
         
-        print(f"输出格式: 1声道, {sample_width*8}bit, {framerate}Hz, {len(mono_samples)/framerate:.1f}秒")
+        print(f"输出格式: 1声道, {sample_width*8}bit, {framerate}Hz, {mono_count/framerate:.1f}秒")
         print(f"✅ 转换完成: {output_file}")
         
         return output_file
 
 
+def _design_resample_filter(up: int, down: int):
+    """
+    设计与 scipy.signal.resample_poly 相同的多相低通滤波器
+    
+    Returns:
+        (h, n_pre_remove): 已前置补零的滤波器系数，以及需要丢弃的起始输出点数
+    """
+    import numpy as np
+    from scipy import signal
+    
+    max_rate = max(up, down)
+    half_len = 10 * max_rate
+    h = signal.firwin(2 * half_len + 1, 1.0 / max_rate, window=('kaiser', 5.0)) * up
+    
+    # 前置补零使输出点对齐到滤波器中心
+    n_pre_pad = down - half_len % down
+    h = np.concatenate((np.zeros(n_pre_pad), h))
+    n_pre_remove = (half_len + n_pre_pad) // down
+    return h, n_pre_remove
+
+
 def resample_audio(input_file: str, target_rate: int = 16000, output_file: str = None):
     """
-    重采样音频（简单实现，建议使用 ffmpeg 或 librosa）
+    重采样音频（多相滤波实现，也可使用 ffmpeg 或 librosa）
+    
+    按块流式处理，块之间保留滤波器所需的历史样本，结果与整段调用
+    scipy.signal.resample_poly 一致
     
     Args:
         input_file: 输入文件
@@ -99,31 +179,55 @@ def resample_audio(input_file: str, target_rate: int = 16000, output_file: str =
                 print(f"采样率已经是 {target_rate}Hz，无需重采样")
                 return input_file
             
-            # 读取音频数据
-            frames = wf_in.readframes(nframes)
-            
-            if sample_width == 2:
-                samples = np.frombuffer(frames, dtype=np.int16)
-            else:
+            if sample_width != 2:
                 raise ValueError(f"不支持的采样宽度: {sample_width}")
             
-            # 如果是多声道，reshape
-            if channels > 1:
-                samples = samples.reshape(-1, channels)
+            # 多相滤波，整数升/降采样因子
+            g = gcd(target_rate, framerate)
+            up, down = target_rate // g, framerate // g
+            h, skip = _design_resample_filter(up, down)
+            
+            # 输出总帧数与 resample_poly 一致: ceil(nframes * up / down)
+            remaining = -(-nframes * up // down)
             
-            # 重采样
-            num_samples = int(len(samples) * target_rate / framerate)
-            resampled = signal.resample(samples, num_samples)
+            # 块长与历史长度均取 down 的整数倍，保证各块的输出相位连续
+            block_frames = max(1, framerate // down) * down
+            context_frames = -(-len(h) // up)
+            context_frames = -(-context_frames // down) * down
+            first_output = context_frames * up // down
+            block_outputs = block_frames * up // down
             
-            # 转换回 int16
-            resampled = resampled.astype(np.int16)
+            # 可复用的缓冲区: [历史样本 | 当前块]
+            buf = np.zeros((context_frames + block_frames, channels))
             
-            # 写入文件
             with wave.open(output_file, 'wb') as wf_out:
                 wf_out.setnchannels(channels)
                 wf_out.setsampwidth(sample_width)
                 wf_out.setframerate(target_rate)
-                wf_out.writeframes(resampled.tobytes())
+                
+                while remaining > 0:
+                    # 读到文件末尾后继续送入静音，把滤波器延迟部分的输出冲刷出来
+                    frames = wf_in.readframes(block_frames)
+                    samples = np.frombuffer(frames, dtype='<i2').reshape(-1, channels)
+                    n = len(samples)
+                    buf[:context_frames] = buf[-context_frames:]
+                    buf[context_frames:context_frames + n] = samples
+                    buf[context_frames + n:] = 0
+                    
+                    y = signal.upfirdn(h, buf, up, down, axis=0)
+                    y = y[first_output:first_output + block_outputs]
+                    
+                    # 丢弃滤波器延迟对应的起始输出
+                    if skip:
+                        dropped = min(skip, len(y))
+                        y = y[dropped:]
+                        skip -= dropped
+                    
+                    y = y[:remaining]
+                    remaining -= len(y)
+                    
+                    # 转换回 int16
+                    wf_out.writeframes(np.clip(y, -32768, 32767).astype('<i2').tobytes())
             
             print(f"✅ 重采样完成: {output_file}")
             return output_file
@@ -7,17 +7,121 @@
 """
 
 import os
+import re
 import json
 import asyncio
 import websockets
 import wave
 import uuid
+import time
 from pathlib import Path
 
 
+# 发送进度的最小打印间隔（秒），避免在发送循环中频繁输出
+PROGRESS_INTERVAL = 0.5
+
+# 设置环境变量 GUMMY_DEBUG=1 时打印每条识别结果的原始事件
+DEBUG = bool(os.environ.get('GUMMY_DEBUG'))
+
+# 接收循环中的 JSON 解析优先使用 orjson（可直接解析 bytes）
+try:
+    import orjson
+    
+    _loads = orjson.loads
+    
+    def _dumps_pretty(obj):
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2).decode()
+except ImportError:
+    _loads = json.loads
+    
+    def _dumps_pretty(obj):
+        return json.dumps(obj, ensure_ascii=False, indent=2)
+
+
+# Gummy 支持的采样率（PCM 需为 16bit 单声道）
+SUPPORTED_SAMPLE_RATES = (8000, 16000)
+
+# 原始 PCM 文件名中的格式后缀，如 foo_48k_s16le.pcm / foo_16k_s16le_2ch.pcm
+_PCM_SUFFIX_RE = re.compile(r'_(\d+(?:\.\d+)?)k_s(8|16|24|32)le(?:_(\d+)ch)?$', re.IGNORECASE)
+
+
+def _detect_pcm_params(audio_file_path: str, rate: int = None,
+                       sample_width: int = None, channels: int = None):
+    """
+    确定原始 PCM 文件的音频参数
+    
+    优先级：显式参数 > 同名 .json 描述文件 > 文件名后缀 > 默认值 (16kHz, 16bit, 单声道)
+    
+    Returns:
+        (rate, sample_width, channels)
+    """
+    detected = {}
+    path = Path(audio_file_path)
+    
+    sidecar = path.with_suffix('.json')
+    if sidecar.exists():
+        with open(sidecar, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        detected = {
+            'rate': meta.get('sample_rate'),
+            'sample_width': meta.get('sample_width'),
+            'channels': meta.get('channels'),
+        }
+    else:
+        match = _PCM_SUFFIX_RE.search(path.stem)
+        if match:
+            detected = {
+                'rate': int(float(match.group(1)) * 1000),
+                'sample_width': int(match.group(2)) // 8,
+                'channels': int(match.group(3)) if match.group(3) else None,
+            }
+    
+    rate = rate or detected.get('rate') or 16000
+    sample_width = sample_width or detected.get('sample_width') or 2
+    channels = channels or detected.get('channels') or 1
+    return rate, sample_width, channels
+
+
+def _probe_audio_params(audio_file_path: str):
+    """
+    获取音频文件参数：WAV 读取文件头，原始 PCM 使用 _detect_pcm_params
+    
+    Returns:
+        (rate, sample_width, channels)
+    """
+    if audio_file_path.endswith('.wav'):
+        with wave.open(audio_file_path, 'rb') as wf:
+            return wf.getframerate(), wf.getsampwidth(), wf.getnchannels()
+    return _detect_pcm_params(audio_file_path)
+
+
+def _check_audio_params(rate: int, sample_width: int, channels: int):
+    """检查音频参数是否满足 Gummy 要求，不满足时抛出 ValueError"""
+    if channels != 1 or sample_width != 2 or rate not in SUPPORTED_SAMPLE_RATES:
+        raise ValueError(
+            f"不支持的音频格式: {channels}声道, {sample_width*8}bit, {rate}Hz；"
+            f"需要单声道 16bit、采样率 {'/'.join(map(str, SUPPORTED_SAMPLE_RATES))}Hz，"
+            f"可使用 convert_audio.py 转换"
+        )
+
+
 class GummyWebSocketClient:
     """Gummy WebSocket 客户端"""
     
+    # 指令报文模板（紧凑 JSON），字段结构固定，只填充少量参数
+    # 字符串参数以 json.dumps 编码后填入，保证转义正确
+    _RUN_TASK_TMPL = (
+        '{"header":{"task_id":"%s","action":"run-task","streaming":"duplex"},'
+        '"payload":{"task_group":"audio","task":"asr","function":"recognition",'
+        '"model":"gummy-realtime-v1","input":{"format":%s,"sample_rate":%d,'
+        '"audio_type":"sentence","translation":{"target_lang":%s,"source_lang":%s}},'
+        '"parameters":{"max_end_silence":%d,"enable_inverse_text_normalization":%s}}}'
+    )
+    _FINISH_TASK_TMPL = (
+        '{"header":{"task_id":"%s","action":"finish-task","streaming":"duplex"},'
+        '"payload":{"input":{}}}'
+    )
+    
     def __init__(self, api_key: str):
         """
         初始化客户端
@@ -27,19 +131,21 @@ class GummyWebSocketClient:
         """
         self.api_key = api_key
         self.url = "wss://dashscope.aliyuncs.com/api-ws/v1/inference"
-        self.task_id = str(uuid.uuid4())
+        self.task_id = uuid.uuid4().hex
         self.websocket = None
         
+        # 连接请求头与 finish-task 指令只依赖实例参数，初始化时构建一次，重连时复用
+        self._headers = (
+            ("Authorization", f"bearer {self.api_key}"),
+            ("user-agent", "GummyTest/1.0"),
+            ("X-DashScope-DataInspection", "enable"),
+        )
+        self._finish_task_message = self._FINISH_TASK_TMPL % self.task_id
+        
     async def connect(self):
         """建立 WebSocket 连接"""
-        headers = {
-            "Authorization": f"bearer {self.api_key}",
-            "user-agent": "GummyTest/1.0",
-            "X-DashScope-DataInspection": "enable"
-        }
-        
         print(f"🔗 正在连接到服务器...")
-        self.websocket = await websockets.connect(self.url, extra_headers=headers)
+        self.websocket = await websockets.connect(self.url, extra_headers=self._headers)
         print(f"✅ 连接成功! Task ID: {self.task_id}")
         
     async def send_run_task(self, 
@@ -60,32 +166,15 @@ class GummyWebSocketClient:
             max_end_silence: 最大静音时长(ms)，默认5000ms（适用于长音频）
             enable_inverse_text_normalization: 是否启用逆文本正则化
         """
-        run_task_message = {
-            "header": {
-                "task_id": self.task_id,
-                "action": "run-task",
-                "streaming": "duplex"
-            },
-            "payload": {
-                "task_group": "audio",
-                "task": "asr",
-                "function": "recognition",
-                "model": "gummy-realtime-v1",
-                "input": {
-                    "format": format,
-                    "sample_rate": sample_rate,
-                    "audio_type": "sentence",
-                    "translation": {
-                        "target_lang": target_lang,
-                        "source_lang": source_lang
-                    }
-                },
-                "parameters": {
-                    "max_end_silence": max_end_silence,
-                    "enable_inverse_text_normalization": enable_inverse_text_normalization
-                }
-            }
-        }
+        run_task_message = self._RUN_TASK_TMPL % (
+            self.task_id,
+            json.dumps(format),
+            sample_rate,
+            json.dumps(target_lang),
+            json.dumps(source_lang),
+            max_end_silence,
+            'true' if enable_inverse_text_normalization else 'false',
+        )
         
         print(f"📤 发送 run-task 指令...")
         print(f"   - 目标语言: {target_lang}")
@@ -93,15 +182,22 @@ class GummyWebSocketClient:
         print(f"   - 格式: {format}")
         print(f"   - 静音检测时长: {max_end_silence} ms")
         
-        await self.websocket.send(json.dumps(run_task_message))
+        # 指令必须以文本帧发送，二进制帧会被服务端当作音频数据
+        await self.websocket.send(run_task_message)
         
-    async def send_audio_data(self, audio_file_path: str, chunk_size: int = 3200):
+    async def send_audio_data(self, audio_file_path: str, chunk_size: int = 3200,
+                              pcm_rate: int = None,
+                              pcm_sample_width: int = None,
+                              pcm_channels: int = None):
         """
         发送音频数据流
         
         Args:
             audio_file_path: 音频文件路径 (PCM 格式)
             chunk_size: 每次发送的数据块大小 (字节)
+            pcm_rate: 原始 PCM 的采样率，未指定时自动检测
+            pcm_sample_width: 原始 PCM 的采样宽度（字节），未指定时自动检测
+            pcm_channels: 原始 PCM 的声道数，未指定时自动检测
         """
         if not os.path.exists(audio_file_path):
             raise FileNotFoundError(f"音频文件不存在: {audio_file_path}")
@@ -127,23 +223,33 @@ class GummyWebSocketClient:
                 if duration > 60:
                     raise ValueError(f"音频时长 {duration:.1f} 秒超过限制（最大60秒）")
                 
-                # 每次读取的帧数
-                frames_per_chunk = chunk_size // (sample_width * channels)
-                sent_frames = 0
+                # 一次性读取全部 PCM 数据（最长 60 秒，约 2MB）
+                # 在工作线程中读取，避免阻塞事件循环中的接收协程
+                raw = await asyncio.to_thread(wf.readframes, total_frames)
+            
+            # 按块切片发送（memoryview 切片不复制数据）
+            audio_view = memoryview(raw)
+            bytes_per_frame = sample_width * channels
+            bytes_per_chunk = (chunk_size // bytes_per_frame) * bytes_per_frame
+            sent_frames = 0
+            start = last_print = time.monotonic()
+            
+            for offset in range(0, len(audio_view), bytes_per_chunk):
+                data = audio_view[offset:offset + bytes_per_chunk]
                 
-                while True:
-                    data = wf.readframes(frames_per_chunk)
-                    if not data:
-                        print(f"   not data..")
-                        break
-                    
-                    await self.websocket.send(data)
-                    sent_frames += frames_per_chunk
-                    
-                    # 模拟实时流式发送，按照实际播放速度
-                    await asyncio.sleep(frames_per_chunk / framerate)
-                    
-                    # 显示进度
+                await self.websocket.send(data)
+                sent_frames += len(data) // bytes_per_frame
+                
+                # 模拟实时流式发送，按照实际播放速度
+                # 以开始时间为基准计算截止时间，避免逐块 sleep 累积误差
+                delay = start + sent_frames / framerate - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                
+                # 显示进度（限制打印频率）
+                now = time.monotonic()
+                if now - last_print >= PROGRESS_INTERVAL:
+                    last_print = now
                     progress = min((sent_frames / total_frames) * 100, 100)
                     print(f"   发送进度: {progress:.1f}%", end='\r')
                     
@@ -151,48 +257,51 @@ class GummyWebSocketClient:
             # 原始 PCM 文件
             file_size = os.path.getsize(audio_file_path)
             
-            # 假设 16kHz, 16bit, 单声道
-            duration = file_size / (16000 * 2)
-            print(f"   音频信息: 1通道, 16bit, 16000Hz, {duration:.1f}秒")
+            # 从描述文件或文件名检测参数，默认 16kHz, 16bit, 单声道
+            rate, sample_width, channels = _detect_pcm_params(
+                audio_file_path, pcm_rate, pcm_sample_width, pcm_channels
+            )
+            bytes_per_sec = rate * sample_width * channels
+            duration = file_size / bytes_per_sec
+            print(f"   音频信息: {channels}通道, {sample_width*8}bit, {rate}Hz, {duration:.1f}秒")
             
             if duration > 60:
                 raise ValueError(f"音频时长 {duration:.1f} 秒超过限制（最大60秒）")
             
+            # 多声道等格式会被服务端按单声道 16bit 误读，直接拒绝
+            _check_audio_params(rate, sample_width, channels)
+            
             with open(audio_file_path, 'rb') as f:
                 sent_size = 0
+                start = last_print = time.monotonic()
                 
                 while True:
-                    data = f.read(chunk_size)
+                    data = await asyncio.to_thread(f.read, chunk_size)
                     if not data:
                         break
                     
                     await self.websocket.send(data)
                     sent_size += len(data)
                     
-                    # 模拟实时流式发送 (16kHz, 16bit)
-                    await asyncio.sleep(len(data) / (16000 * 2))
+                    # 模拟实时流式发送，按截止时间调度
+                    delay = start + sent_size / bytes_per_sec - time.monotonic()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
                     
-                    # 显示进度
-                    progress = min((sent_size / file_size) * 100, 100)
-                    print(f"   发送进度: {progress:.1f}%", end='\r')
+                    # 显示进度（限制打印频率）
+                    now = time.monotonic()
+                    if now - last_print >= PROGRESS_INTERVAL:
+                        last_print = now
+                        progress = min((sent_size / file_size) * 100, 100)
+                        print(f"   发送进度: {progress:.1f}%", end='\r')
         
         print(f"\n✅ 音频数据发送完成!")
         
     async def send_finish_task(self):
         """发送 finish-task 指令结束任务"""
-        finish_task_message = {
-            "header": {
-                "task_id": self.task_id,
-                "action": "finish-task",
-                "streaming": "duplex"
-            },
-            "payload": {
-                "input": {}
-            }
-        }
-        
         print(f"📤 发送 finish-task 指令...")
-        await self.websocket.send(json.dumps(finish_task_message))
+        # 指令必须以文本帧发送，二进制帧会被服务端当作音频数据
+        await self.websocket.send(self._finish_task_message)
         
     async def receive_messages(self):
         """接收服务器消息"""
@@ -201,7 +310,7 @@ class GummyWebSocketClient:
         try:
             async for message in self.websocket:
                 try:
-                    event = json.loads(message)
+                    event = _loads(message)
                     event_type = event.get("header", {}).get("event")
                     
                     if event_type == "task-started":
@@ -226,7 +335,7 @@ class GummyWebSocketClient:
                         if error_code == "TOO_LONG_SPEECH":
                             print("\n⚠️  提示: 音频时长超过 60 秒限制，请使用较短的音频文件")
                         
-                        print(f"\n详细信息: {json.dumps(event, ensure_ascii=False, indent=2)}")
+                        print(f"\n详细信息: {_dumps_pretty(event)}")
                         break
                         
                 except json.JSONDecodeError as e:
@@ -240,7 +349,8 @@ class GummyWebSocketClient:
         payload = event.get("payload", {})
         output = payload.get("output", {})
         
-        print(f"Received result: {event}")
+        if DEBUG:
+            print("Received result:", event)
         # 识别结果
         transcription = output.get("transcription", {})
         if transcription:
@@ -284,6 +394,17 @@ async def test_with_audio_file(api_key: str, audio_file: str, target_lang: str =
         audio_file: 音频文件路径 (支持 WAV 或原始 PCM)
         target_lang: 目标语言
     """
+    # 连接前确定音频参数，run-task 中声明的采样率需与实际发送的数据一致
+    if not os.path.exists(audio_file):
+        print(f"❌ 错误: 音频文件不存在: {audio_file}")
+        return
+    rate, sample_width, channels = _probe_audio_params(audio_file)
+    try:
+        _check_audio_params(rate, sample_width, channels)
+    except ValueError as e:
+        print(f"❌ 错误: {e}")
+        return
+    
     client = GummyWebSocketClient(api_key)
     
     try:
@@ -300,7 +421,7 @@ async def test_with_audio_file(api_key: str, audio_file: str, target_lang: str =
         await client.send_run_task(
             target_lang=target_lang,
             source_lang="auto",
-            sample_rate=16000,
+            sample_rate=rate,
             format="pcm",
             max_end_silence=10000  # 增加到10秒，避免过早结束
         )
@@ -372,8 +493,10 @@ async def test_with_microphone(api_key: str, target_lang: str = "en", duration:
         # 4. 录音并发送
         print(f"🎤 开始录音 (时长: {duration}秒)...")
         
-        audio = pyaudio.PyAudio()
-        stream = audio.open(
+        # PyAudio 初始化、读取与释放均为阻塞调用，放到工作线程执行
+        audio = await asyncio.to_thread(pyaudio.PyAudio)
+        stream = await asyncio.to_thread(
+            audio.open,
             format=FORMAT,
             channels=CHANNELS,
             rate=RATE,
@@ -382,21 +505,28 @@ async def test_with_microphone(api_key: str, target_lang: str = "en", duration:
         )
         
         frames_to_record = int(RATE / CHUNK * duration)
+        last_print = time.monotonic()
         
         for i in range(frames_to_record):
-            data = stream.read(CHUNK)
+            data = await asyncio.to_thread(stream.read, CHUNK)
             await client.websocket.send(data)
             
-            # 显示进度
-            progress = ((i + 1) / frames_to_record) * 100
-            print(f"   录音进度: {progress:.1f}%", end='\r')
+            # 显示进度（限制打印频率）
+            now = time.monotonic()
+            if now - last_print >= PROGRESS_INTERVAL:
+                last_print = now
+                progress = ((i + 1) / frames_to_record) * 100
+                print(f"   录音进度: {progress:.1f}%", end='\r')
         
         print(f"\n✅ 录音完成!")
         
         # 关闭音频流
-        stream.stop_stream()
-        stream.close()
-        audio.terminate()
+        def _close_audio():
+            stream.stop_stream()
+            stream.close()
+            audio.terminate()
+        
+        await asyncio.to_thread(_close_audio)
         
         # 5. 发送 finish-task 指令
         await client.send_finish_task()
@@ -8,14 +8,30 @@
 
 环境变量:
     DASHSCOPE_API_KEY - 阿里云 API Key
+    QWEN_TTS_USE_CACHE - 设为 1 时启用本地合成缓存（命中时不会实际请求 API）
 """
 
 import os
 import sys
 import json
-import requests
+import shutil
+import asyncio
+import hashlib
+import threading
+import aiohttp
+import aiofiles
 from pathlib import Path
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# 路径
+TEST_DIR = Path(__file__).resolve().parent
+CN_OUT = TEST_DIR / "test_tts_output.mp3"
+EN_OUT = TEST_DIR / "test_tts_english.mp3"
+
 # 配置
 API_ENDPOINT = "https://dashscope.aliyuncs.com/api/v1/services/aigc/multimodal-generation/generation"
 MODEL = "qwen3-tts-flash"
@@ -23,161 +39,339 @@ TEST_TEXT = "你好，我是通义千问语音合成服务。今天天气真不
 VOICE = "Cherry"
 LANGUAGE_TYPE = "Chinese"
 
-def test_tts_api():
-    """测试 TTS API"""
-    # 获取 API Key
-    api_key = os.getenv("DASHSCOPE_API_KEY")
-    if not api_key:
-        print("❌ 错误: 未设置 DASHSCOPE_API_KEY 环境变量")
-        print("\n设置方法:")
-        print("  export DASHSCOPE_API_KEY='sk-your-api-key'")
-        return False
-    
-    print("🔑 API Key:", api_key[:10] + "..." if len(api_key) > 10 else api_key)
-    print(f"🎯 测试文本: {TEST_TEXT}")
-    print(f"🎙️  音色: {VOICE}")
-    print(f"🌐 语言: {LANGUAGE_TYPE}")
-    print()
-    
-    # 构建请求
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json"
-    }
-    
-    payload = {
-        "model": MODEL,
+# DashScope 接口请求头模板（认证头在运行时补充）
+# 只随 API 请求发送，音频下载走第三方 OSS/CDN 预签名 URL，不能携带 API Key
+HEADERS_TEMPLATE = {"Content-Type": "application/json"}
+
+# 设置 TEST_TTS_VERBOSE=1 时打印完整的接口响应
+VERBOSE = os.getenv("TEST_TTS_VERBOSE", "0") == "1"
+
+EN_TEXT = "Hello! This is Qwen Text to Speech service. How are you today?"
+EN_VOICE = "Emily"
+EN_LANGUAGE_TYPE = "English"
+
+# 连接与读取超时分开设置（秒）：连接失败快速报错，长音频下载不被整体超时截断
+CONNECT_TIMEOUT = float(os.getenv("QWEN_TTS_CONNECT_TIMEOUT", "5"))
+READ_TIMEOUT = float(os.getenv("QWEN_TTS_READ_TIMEOUT", "60"))
+
+# 瞬时网关错误的重试策略
+MAX_RETRIES = 2
+RETRY_BACKOFF = 0.3
+RETRY_STATUSES = frozenset({502, 503, 504})
+
+# 音频下载按块写入文件的大小，内存占用与音频长度无关
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+# 本地合成缓存：相同的模型/音色/语言/文本直接复用已下载的音频
+# 本脚本用于验证 API 连接，缓存默认关闭，设置 QWEN_TTS_USE_CACHE=1 时启用
+USE_CACHE = os.getenv("QWEN_TTS_USE_CACHE", "0") == "1"
+CACHE_DIR = TEST_DIR / "cache"
+CACHE_MAX_FILES = 32
+# 缓存清单：记录每个音频的 SHA-256、大小与服务端 ETag
+CACHE_MANIFEST = CACHE_DIR / "manifest.json"
+_manifest_lock = threading.Lock()
+
+
+def build_payload(text, voice, language_type, model=MODEL):
+    """构建 TTS 请求数据"""
+    return {
+        "model": model,
         "input": {
-            "text": TEST_TEXT,
-            "voice": VOICE,
-            "language_type": LANGUAGE_TYPE
+            "text": text,
+            "voice": voice,
+            "language_type": language_type
         }
     }
+
+
+def encode_body(payload):
+    """编码为 UTF-8 紧凑 JSON 请求体（优先使用 orjson）"""
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def build_body(text, voice, language_type, model=MODEL):
+    """构建并编码请求体，便于临时测试其他文本/音色"""
+    return encode_body(build_payload(text, voice, language_type, model))
+
+
+# 测试语料为固定内容，导入时构建并编码一次，发送时直接写出字节
+CN_PAYLOAD = build_payload(TEST_TEXT, VOICE, LANGUAGE_TYPE)
+EN_PAYLOAD = build_payload(EN_TEXT, EN_VOICE, EN_LANGUAGE_TYPE)
+CN_BODY = encode_body(CN_PAYLOAD)
+EN_BODY = encode_body(EN_PAYLOAD)
+
+
+def _api_headers(api_key):
+    """构建 DashScope 接口请求头"""
+    return {**HEADERS_TEMPLATE, "Authorization": f"Bearer {api_key}"}
+
+
+def _cache_path(body):
+    """按请求体 (model|voice|language_type|text) 的 SHA-256 计算缓存文件路径"""
+    return CACHE_DIR / f"{hashlib.sha256(body).hexdigest()}.mp3"
+
+
+def _read_manifest():
+    """读取缓存清单，不存在或损坏时返回空清单"""
+    try:
+        return json.loads(CACHE_MANIFEST.read_text(encoding="utf-8"))
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def _load_from_cache(body, out_path):
+    """命中缓存时复制到输出路径并返回文件大小，否则返回 None"""
+    cache_path = _cache_path(body)
+    with _manifest_lock:
+        entry = _read_manifest().get(cache_path.stem)
+    
+    # 以清单记录的大小校验缓存文件，无需重新计算哈希
+    if entry is None or not cache_path.exists() or cache_path.stat().st_size != entry["size"]:
+        return None
+    shutil.copyfile(cache_path, out_path)
+    os.utime(cache_path)  # 更新修改时间，供 LRU 淘汰使用
+    return entry["size"]
+
+
+def _save_to_cache(body, out_path, digest, size, etag=None):
+    """保存音频与清单记录，超出数量上限时按修改时间淘汰最旧的文件"""
+    CACHE_DIR.mkdir(exist_ok=True)
+    cache_path = _cache_path(body)
+    shutil.copyfile(out_path, cache_path)
     
-    print("📤 发送 TTS 请求...")
+    with _manifest_lock:
+        manifest = _read_manifest()
+        manifest[cache_path.stem] = {"sha256": digest, "size": size, "etag": etag}
+        
+        cached = sorted(CACHE_DIR.glob("*.mp3"), key=lambda p: p.stat().st_mtime)
+        for stale in cached[:-CACHE_MAX_FILES]:
+            stale.unlink(missing_ok=True)
+            manifest.pop(stale.stem, None)
+        
+        CACHE_MANIFEST.write_text(
+            json.dumps(manifest, ensure_ascii=False, indent=2), encoding="utf-8"
+        )
+
+
+def _dump_response(label, result, log):
+    """记录完整响应数据到日志（仅调试时使用）"""
+    log.append("")
+    log.append(f"📄 [{label}] 响应数据:")
+    if orjson is not None:
+        log.append(
+            orjson.dumps(result, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS).decode()
+        )
+    else:
+        log.append(json.dumps(result, indent=2, ensure_ascii=False))
+    log.append("")
+
+
+async def _request(method, url, **kwargs):
+    """
+    发送请求，遇到连接错误或 502/503/504 时按指数退避重试
+    
+    Args:
+        method: 会话的请求方法，如 session.post / session.get
+    """
+    for attempt in range(MAX_RETRIES + 1):
+        retry_left = attempt < MAX_RETRIES
+        try:
+            response = await method(url, **kwargs)
+        except aiohttp.ClientConnectionError:
+            if not retry_left:
+                raise
+        else:
+            if response.status not in RETRY_STATUSES or not retry_left:
+                return response
+            response.release()
+        await asyncio.sleep(RETRY_BACKOFF * (2 ** attempt))
+
+
+async def download_audio(session, audio_url, out_path):
+    """
+    流式下载合成好的音频并写入文件（文件写入不阻塞事件循环）
+    
+    下载的同时计算 SHA-256，无需写入后再读一遍文件
+    
+    Returns:
+        (HTTP 状态码, 音频字节数, SHA-256 十六进制摘要, 服务端 ETag)
+    """
+    async with await _request(session.get, audio_url) as r:
+        if r.status != 200:
+            return r.status, 0, None, None
+        
+        file_size = 0
+        h = hashlib.sha256()
+        async with aiofiles.open(out_path, "wb") as f:
+            async for chunk in r.content.iter_chunked(DOWNLOAD_CHUNK_SIZE):
+                h.update(chunk)
+                await f.write(chunk)
+                file_size += len(chunk)
+        etag = r.headers.get("ETag")
+    
+    return r.status, file_size, h.hexdigest(), etag
+
+
+async def _synth(session, body, out_path, label, log, headers):
+    """
+    执行一次完整的 TTS 测试：查缓存 -> 请求合成 -> 提取音频 URL -> 下载保存
+    
+    Args:
+        session: 共享的 aiohttp 会话
+        body: 预先编码好的 JSON 请求体 (bytes)
+        out_path: 音频输出路径
+        label: 输出日志中的测试名称，如 "中文" / "英文"
+        log: 日志行列表，输出先缓存到这里，由调用方统一打印
+        headers: DashScope 接口请求头（含认证），仅用于合成请求
+    
+    Returns:
+        (是否成功, 是否来自本地缓存)
+    """
+    # 启用缓存且命中时跳过网络请求
+    if USE_CACHE:
+        file_size = await asyncio.to_thread(_load_from_cache, body, out_path)
+        if file_size is not None:
+            log.append(f"♻️  [{label}] 命中本地缓存，跳过 TTS 请求（未验证 API 连接）")
+            log.append(f"📦 [{label}] 文件大小: {file_size} bytes")
+            log.append(f"💾 [{label}] 保存路径: {out_path}")
+            return True, True
+    
+    log.append(f"📤 发送{label} TTS 请求...")
     
     try:
         # 发送请求
-        response = requests.post(
-            API_ENDPOINT,
-            headers=headers,
-            json=payload,
-            timeout=30
-        )
+        async with await _request(session.post, API_ENDPOINT, data=body, headers=headers) as response:
+            log.append(f"📥 [{label}] 响应状态码: {response.status}")
+            
+            # 检查状态码
+            if response.status != 200:
+                log.append(f"❌ [{label}] 请求失败: {response.status}")
+                log.append(f"响应内容: {await response.text()}")
+                return False, False
+            
+            # 解析响应
+            result = await response.json()
         
-        print(f"📥 响应状态码: {response.status_code}")
+        log.append(f"✅ [{label}] 请求成功!")
+        if VERBOSE:
+            _dump_response(label, result, log)
         
-        # 检查状态码
-        if response.status_code != 200:
-            print(f"❌ 请求失败: {response.status_code}")
-            print(f"响应内容: {response.text}")
-            return False
+        # 提取音频 URL（output 缺失或为 null 时同样视为未找到）
+        output = result.get("output") or {}
+        audio_url = output.get("audio_url")
+        if audio_url is None:
+            log.append(f"❌ [{label}] 响应中未找到 audio_url")
+            return False, False
         
-        # 解析响应
-        result = response.json()
-        print("✅ 请求成功!")
-        print()
-        print("📄 响应数据:")
-        print(json.dumps(result, indent=2, ensure_ascii=False))
-        print()
+        log.append(f"🔗 [{label}] 音频 URL: {audio_url}")
+        finish_reason = output.get("finish_reason")
+        if finish_reason:
+            log.append(f"🏁 [{label}] 结束原因: {finish_reason}")
         
-        # 提取音频 URL
-        if "output" in result and "audio_url" in result["output"]:
-            audio_url = result["output"]["audio_url"]
-            print(f"🔗 音频 URL: {audio_url}")
-            
-            # 下载音频文件
-            print("⬇️  下载音频文件...")
-            audio_response = requests.get(audio_url, timeout=30)
-            
-            if audio_response.status_code == 200:
-                # 保存音频文件
-                output_dir = Path(__file__).parent
-                output_file = output_dir / "test_tts_output.mp3"
-                
-                with open(output_file, "wb") as f:
-                    f.write(audio_response.content)
-                
-                file_size = len(audio_response.content)
-                print(f"✅ 音频下载成功!")
-                print(f"📦 文件大小: {file_size} bytes")
-                print(f"💾 保存路径: {output_file}")
-                print()
-                print("🎵 你可以播放该文件来测试音频质量:")
-                print(f"   open {output_file}")
-                return True
-            else:
-                print(f"❌ 音频下载失败: {audio_response.status_code}")
-                return False
-        else:
-            print("❌ 响应中未找到 audio_url")
-            return False
-            
-    except requests.exceptions.Timeout:
-        print("❌ 请求超时")
-        return False
-    except requests.exceptions.RequestException as e:
-        print(f"❌ 请求异常: {e}")
-        return False
+        # 下载音频文件
+        log.append(f"⬇️  [{label}] 下载音频文件...")
+        status, file_size, digest, etag = await download_audio(session, audio_url, out_path)
+        
+        if status != 200:
+            log.append(f"❌ [{label}] 音频下载失败: {status}")
+            return False, False
+        
+        if USE_CACHE:
+            await asyncio.to_thread(_save_to_cache, body, out_path, digest, file_size, etag)
+        log.append(f"✅ [{label}] 音频下载成功!")
+        log.append(f"📦 [{label}] 文件大小: {file_size} bytes")
+        log.append(f"💾 [{label}] 保存路径: {out_path}")
+        return True, False
+    
+    except asyncio.TimeoutError:
+        log.append(f"❌ [{label}] 请求超时")
+        return False, False
+    except aiohttp.ClientError as e:
+        log.append(f"❌ [{label}] 请求异常: {e}")
+        return False, False
     except json.JSONDecodeError as e:
-        print(f"❌ JSON 解析失败: {e}")
-        return False
+        log.append(f"❌ [{label}] JSON 解析失败: {e}")
+        return False, False
     except Exception as e:
-        print(f"❌ 未知错误: {e}")
+        log.append(f"❌ [{label}] 未知错误: {e}")
         import traceback
-        traceback.print_exc()
-        return False
+        log.append(traceback.format_exc())
+        return False, False
+
 
-def test_english_tts():
-    """测试英文 TTS"""
+async def test_tts_api(session):
+    """
+    测试 TTS API
+    
+    Returns:
+        (是否成功, 是否来自本地缓存, 日志文本)
+    """
+    log = []
+    # 获取 API Key
     api_key = os.getenv("DASHSCOPE_API_KEY")
     if not api_key:
-        print("❌ 错误: 未设置 DASHSCOPE_API_KEY 环境变量")
-        return False
+        log.append("❌ 错误: 未设置 DASHSCOPE_API_KEY 环境变量")
+        log.append("\n设置方法:")
+        log.append("  export DASHSCOPE_API_KEY='sk-your-api-key'")
+        return False, False, "\n".join(log)
     
-    print("\n" + "="*60)
-    print("测试英文语音合成")
-    print("="*60 + "\n")
+    log.append(f"🔑 API Key: {api_key[:10] + '...' if len(api_key) > 10 else api_key}")
+    log.append(f"🎯 测试文本: {TEST_TEXT}")
+    log.append(f"🎙️  音色: {VOICE}")
+    log.append(f"🌐 语言: {LANGUAGE_TYPE}")
+    log.append("")
     
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json"
-    }
+    success, cached = await _synth(session, CN_BODY, CN_OUT, "中文", log, _api_headers(api_key))
+    if success:
+        log.append("")
+        log.append("🎵 你可以播放该文件来测试音频质量:")
+        log.append(f"   open {CN_OUT}")
+    return success, cached, "\n".join(log)
+
+async def test_english_tts(session):
+    """
+    测试英文 TTS
     
-    payload = {
-        "model": MODEL,
-        "input": {
-            "text": "Hello! This is Qwen Text to Speech service. How are you today?",
-            "voice": "Emily",
-            "language_type": "English"
-        }
-    }
+    Returns:
+        (是否成功, 是否来自本地缓存, 日志文本)
+    """
+    log = []
+    api_key = os.getenv("DASHSCOPE_API_KEY")
+    if not api_key:
+        log.append("❌ 错误: 未设置 DASHSCOPE_API_KEY 环境变量")
+        return False, False, "\n".join(log)
     
-    print("📤 发送英文 TTS 请求...")
+    log.append("\n" + "="*60)
+    log.append("测试英文语音合成")
+    log.append("="*60 + "\n")
     
-    try:
-        response = requests.post(API_ENDPOINT, headers=headers, json=payload, timeout=30)
-        print(f"📥 响应状态码: {response.status_code}")
-        
-        if response.status_code == 200:
-            result = response.json()
-            if "output" in result and "audio_url" in result["output"]:
-                audio_url = result["output"]["audio_url"]
-                print(f"🔗 音频 URL: {audio_url}")
-                
-                # 下载音频
-                audio_response = requests.get(audio_url, timeout=30)
-                if audio_response.status_code == 200:
-                    output_file = Path(__file__).parent / "test_tts_english.mp3"
-                    with open(output_file, "wb") as f:
-                        f.write(audio_response.content)
-                    print(f"✅ 英文音频下载成功: {output_file}")
-                    return True
-        
-        return False
-    except Exception as e:
-        print(f"❌ 错误: {e}")
-        return False
+    success, cached = await _synth(session, EN_BODY, EN_OUT, "英文", log, _api_headers(api_key))
+    return success, cached, "\n".join(log)
+
+async def run_tests():
+    """在同一会话中并发执行中英文测试"""
+    # 单个会话复用连接池：DashScope 接口与音频 CDN 各保留长连接
+    # 会话不设置默认请求头，认证头只随合成请求发送
+    async with aiohttp.ClientSession(
+        timeout=aiohttp.ClientTimeout(
+            total=None,
+            connect=CONNECT_TIMEOUT,
+            sock_read=READ_TIMEOUT
+        )
+    ) as session:
+        # 中英文测试互不依赖，一个请求等待时另一个可继续下载
+        return await asyncio.gather(
+            test_tts_api(session),
+            test_english_tts(session)
+        )
+
+def _summary(success, cached):
+    """测试总结中的单项结果"""
+    if not success:
+        return '❌ 失败'
+    return '♻️  通过 (本地缓存)' if cached else '✅ 通过'
 
 def main():
     print("="*60)
@@ -185,21 +379,23 @@ def main():
     print("="*60)
     print()
     
-    # 测试中文
-    success_cn = test_tts_api()
+    (success_cn, cached_cn, log_cn), (success_en, cached_en, log_en) = asyncio.run(run_tests())
     
-    # 测试英文
-    success_en = test_english_tts()
+    # 两个测试并发执行，日志先各自缓存，结束后按顺序一次性输出
+    sys.stdout.write(log_cn + "\n" + log_en + "\n")
     
     print("\n" + "="*60)
     print("测试总结")
     print("="*60)
-    print(f"中文 TTS: {'✅ 通过' if success_cn else '❌ 失败'}")
-    print(f"英文 TTS: {'✅ 通过' if success_en else '❌ 失败'}")
+    print(f"中文 TTS: {_summary(success_cn, cached_cn)}")
+    print(f"英文 TTS: {_summary(success_en, cached_en)}")
     print()
     
     if success_cn and success_en:
-        print("🎉 所有测试通过！阿里云 TTS API 工作正常。")
+        if cached_cn or cached_en:
+            print("♻️  结果来自本地缓存，未实际请求 API；如需验证连接请取消 QWEN_TTS_USE_CACHE。")
+        else:
+            print("🎉 所有测试通过！阿里云 TTS API 工作正常。")
         return 0
     else:
         print("⚠️  部分测试失败，请检查配置。")